@@ -3,91 +3,119 @@ Important file filtering for RepoMap.
 """
 
 import os
+import re
 
-IMPORTANT_FILENAMES = {
-    "README.md",
-    "README.txt",
-    "readme.md",
-    "README.rst",
-    "README",
-    "requirements.txt",
-    "Pipfile",
-    "pyproject.toml",
-    "setup.py",
-    "setup.cfg",
-    "package.json",
-    "yarn.lock",
-    "package-lock.json",
-    "npm-shrinkwrap.json",
-    "Dockerfile",
-    "docker-compose.yml",
-    "docker-compose.yaml",
-    ".gitignore",
-    ".gitattributes",
-    ".dockerignore",
-    "Makefile",
-    "makefile",
-    "CMakeLists.txt",
-    "LICENSE",
-    "LICENSE.txt",
-    "LICENSE.md",
-    "COPYING",
-    "CHANGELOG.md",
-    "CHANGELOG.txt",
-    "HISTORY.md",
-    "CONTRIBUTING.md",
-    "CODE_OF_CONDUCT.md",
-    ".env",
-    ".env.example",
-    ".env.local",
-    "tox.ini",
-    "pytest.ini",
-    ".pytest.ini",
-    ".flake8",
-    ".pylintrc",
-    "mypy.ini",
-    "go.mod",
-    "go.sum",
-    "Cargo.toml",
-    "Cargo.lock",
-    "pom.xml",
-    "build.gradle",
-    "build.gradle.kts",
-    "composer.json",
-    "composer.lock",
-    "Gemfile",
-    "Gemfile.lock",
-}
+IMPORTANT_FILENAMES = frozenset(
+    {
+        "README.md",
+        "README.txt",
+        "README.rst",
+        "README",
+        "requirements.txt",
+        "Pipfile",
+        "pyproject.toml",
+        "setup.py",
+        "setup.cfg",
+        "package.json",
+        "yarn.lock",
+        "package-lock.json",
+        "npm-shrinkwrap.json",
+        "Dockerfile",
+        "docker-compose.yml",
+        "docker-compose.yaml",
+        ".gitignore",
+        ".gitattributes",
+        ".dockerignore",
+        "Makefile",
+        "CMakeLists.txt",
+        "LICENSE",
+        "LICENSE.txt",
+        "LICENSE.md",
+        "COPYING",
+        "CHANGELOG.md",
+        "CHANGELOG.txt",
+        "HISTORY.md",
+        "CONTRIBUTING.md",
+        "CODE_OF_CONDUCT.md",
+        ".env",
+        ".env.example",
+        ".env.local",
+        "tox.ini",
+        "pytest.ini",
+        ".pytest.ini",
+        ".flake8",
+        ".pylintrc",
+        "mypy.ini",
+        "go.mod",
+        "go.sum",
+        "Cargo.toml",
+        "Cargo.lock",
+        "pom.xml",
+        "build.gradle",
+        "build.gradle.kts",
+        "composer.json",
+        "composer.lock",
+        "Gemfile",
+        "Gemfile.lock",
+    }
+)
 
-IMPORTANT_DIR_PATTERNS = {
-    os.path.normpath(".github/workflows"): lambda fname: fname.endswith((".yml", ".yaml")),
-    os.path.normpath(".github"): lambda fname: fname.endswith((".md", ".yml", ".yaml")),
-    os.path.normpath("docs"): lambda fname: fname.endswith((".md", ".rst", ".txt")),
+IMPORTANT_DIR_EXTS = {
+    os.path.normpath(".github/workflows"): frozenset({".yml", ".yaml"}),
+    os.path.normpath(".github"): frozenset({".md", ".yml", ".yaml"}),
+    os.path.normpath("docs"): frozenset({".md", ".rst", ".txt"}),
 }
 
 
-def is_important(rel_file_path: str) -> bool:
-    """Check if a file is considered important."""
-    normalized_path = os.path.normpath(rel_file_path)
-    file_name = os.path.basename(normalized_path)
-    dir_name = os.path.dirname(normalized_path)
+# Filenames are matched case-insensitively (README.md, Readme.md, readme.md, ...)
+_IMPORTANT_LOWER = frozenset(name.lower() for name in IMPORTANT_FILENAMES)
 
-    # Check specific directory patterns
-    for important_dir, checker_func in IMPORTANT_DIR_PATTERNS.items():
-        if dir_name == important_dir and checker_func(file_name):
-            return True
 
-    # Check if the full normalized path is important
-    if normalized_path in IMPORTANT_FILENAMES:
-        return True
+def _build_important_dir_re() -> re.Pattern[str]:
+    """Compile IMPORTANT_DIR_EXTS into one anchored regex over "/"-separated paths."""
+    rules = "|".join(
+        re.escape(dir_name.replace(os.sep, "/"))
+        + "/[^/]*(?:"
+        + "|".join(re.escape(ext) for ext in sorted(exts))
+        + ")"
+        for dir_name, exts in IMPORTANT_DIR_EXTS.items()
+    )
+    return re.compile(rf"(?:{rules})\Z", re.DOTALL)
+
+
+_IMPORTANT_DIR_RE = _build_important_dir_re()
+# Cheap guard so most paths never reach the regex
+_IMPORTANT_DIR_PREFIXES = tuple(
+    dir_name.replace(os.sep, "/") + "/" for dir_name in IMPORTANT_DIR_EXTS
+)
+
+
+def is_important(rel_file_path: str) -> bool:
+    """Check if a file is considered important."""
+    path = rel_file_path
+    # Only pay for normpath when the path has something for it to clean up:
+    # empty or "." / ".." segments, doubled or trailing separators, native separators
+    if (
+        "//" in path
+        or "/./" in path
+        or "/.." in path
+        or path[:2] == "./"
+        or path[-1:] == "/"
+        or path[-2:] == "/."
+        or (os.sep != "/" and os.sep in path)
+    ):
+        path = os.path.normpath(path).replace(os.sep, "/")
 
     # Check if just the basename is important
-    if file_name in IMPORTANT_FILENAMES:
+    if path.rpartition("/")[2].lower() in _IMPORTANT_LOWER:
         return True
 
-    return False
+    # Check specific directory patterns
+    if not path.startswith(_IMPORTANT_DIR_PREFIXES):
+        return False
+    return _IMPORTANT_DIR_RE.match(path) is not None
 
 
 def filter_important_files(file_paths: list[str]) -> list[str]:
     """Filter list to only include important files."""
-    return [path for path in file_paths if is_important(path)]
+    return list(filter(is_important, file_paths))
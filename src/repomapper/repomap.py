@@ -9,48 +9,102 @@ Uses Tree-sitter for parsing and PageRank for ranking importance.
 
 import argparse
 import os
+import stat
 import sys
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
 from pathlib import Path
 
-from .repomap_class import RepoMap
-from .utils import count_tokens, read_text
-
-
-def find_src_files(directory: str) -> list[str]:
-    """Find source files in a directory."""
-    if not os.path.isdir(directory):
-        return [directory] if os.path.isfile(directory) else []
-
-    src_files = []
-    for root, dirs, files in os.walk(directory):
-        # Skip hidden directories and common non-source directories
-        dirs[:] = [
-            d
-            for d in dirs
-            if not d.startswith(".") and d not in {"node_modules", "__pycache__", "venv", "env"}
-        ]
-
-        for file in files:
-            if not file.startswith("."):
-                full_path = os.path.join(root, file)
-                src_files.append(full_path)
-
-    return src_files
+# Directories that never contain source worth mapping (hidden ones are skipped anyway)
+_SKIP_DIRS = frozenset({"node_modules", "__pycache__", "venv", "env"})
+
+
+# Directory listings are I/O bound and os.scandir releases the GIL, so a few threads
+# overlap the per-directory syscall latency. Each task lists up to _DIRS_PER_TASK
+# directories depth-first before handing the rest of its frontier back, which keeps
+# the per-future overhead small on warm caches.
+_WALK_WORKERS = 8
+_DIRS_PER_TASK = 64
+
+
+def _scan_dirs(stack: list[str], skip_dirs: frozenset[str]) -> tuple[list[str], list[str]]:
+    """Walk part of a directory tree, returning (source files, unvisited directories)."""
+    files = []
+    for _ in range(_DIRS_PER_TASK):
+        if not stack:
+            break
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+
+        with it:
+            for entry in it:
+                # Skip hidden entries and common non-source directories
+                name = entry.name
+                if name[0] == ".":
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    # Like os.walk, never descend into symlinked directories
+                    if name not in skip_dirs and not entry.is_symlink():
+                        stack.append(entry.path)
+                else:
+                    files.append(entry.path)
+    return files, stack
+
+
+def find_src_files(directory: str, skip_dirs: frozenset[str] = _SKIP_DIRS) -> Iterator[str]:
+    """Find source files in a directory, yielding paths as they are found.
+
+    Directories named in skip_dirs are not descended into.
+    """
+    # One stat tells us whether the spec is a directory, a plain file, or neither
+    try:
+        mode = os.stat(directory).st_mode
+    except (OSError, ValueError):
+        return
+    if not stat.S_ISDIR(mode):
+        if stat.S_ISREG(mode):
+            yield directory
+        return
+
+    with ThreadPoolExecutor(max_workers=_WALK_WORKERS) as pool:
+        pending = {pool.submit(_scan_dirs, [directory], skip_dirs)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, unvisited = future.result()
+                # Split the leftover frontier across the workers
+                n = min(len(unvisited), _WALK_WORKERS)
+                pending.update(
+                    pool.submit(_scan_dirs, unvisited[i::n], skip_dirs) for i in range(n)
+                )
+                yield from files
+
+
+def resolve_path_spec(path: str) -> str:
+    """Make a CLI path absolute and canonical, matching the resolved --root."""
+    return os.path.realpath(path)
 
 
 def tool_output(*messages):
     """Print informational messages."""
-    print(*messages, file=sys.stdout)
+    sys.stdout.write(" ".join(map(str, messages)) + "\n")
 
 
 def tool_warning(message):
     """Print warning messages."""
-    print(f"Warning: {message}", file=sys.stderr)
+    sys.stderr.write(f"Warning: {message}\n")
 
 
 def tool_error(message):
     """Print error messages."""
-    print(f"Error: {message}", file=sys.stderr)
+    sys.stderr.write(f"Error: {message}\n")
 
 
 def main():
@@ -114,13 +168,25 @@ Examples:
 
     args = parser.parse_args()
 
-    # Set up token counter with specified model
+    # Deferred so --help and argument errors don't pay for tree-sitter/tiktoken imports
+    from .repomap_class import RepoMap
+    from .utils import count_tokens, read_text
+
+    # Set up token counter with specified model. Identical snippets are tokenized
+    # repeatedly while sizing the map, so keep a bounded memo of recent results.
+    @lru_cache(maxsize=2048)
     def token_counter(text: str) -> int:
         return count_tokens(text, args.model)
 
     # Set up output handlers
     output_handlers = {"info": tool_output, "warning": tool_warning, "error": tool_error}
 
+    # Resolve the root before expanding any paths, so a bad root fails before the walk
+    root_path = Path(args.root).resolve()
+    if not root_path.is_dir():
+        tool_error(f"Root directory not found: {args.root}")
+        sys.exit(1)
+
     # Process file arguments
     chat_files_from_args = args.chat_files or []  # These are the paths as strings from the CLI
 
@@ -135,16 +201,19 @@ Examples:
 
     # Now, expand all directory paths in unresolved_paths_for_other_files_specs into actual file lists
     # and collect all file paths. find_src_files handles both files and directories.
-    effective_other_files_unresolved = []
-    for path_spec_str in unresolved_paths_for_other_files_specs:
-        effective_other_files_unresolved.extend(find_src_files(path_spec_str))
+    # Each spec is resolved once up front; the walked paths are joined onto it,
+    # so they are already canonical and need no per-file resolve.
+    # Overlapping specs are deduplicated here, preserving first-seen order.
+    other_files = list(
+        dict.fromkeys(
+            fname
+            for path_spec_str in unresolved_paths_for_other_files_specs
+            for fname in find_src_files(resolve_path_spec(path_spec_str))
+        )
+    )
 
-    # Convert to absolute paths
-    root_path = Path(args.root).resolve()
     # chat_files for RepoMap are from --chat-files argument, resolved.
-    chat_files = [str(Path(f).resolve()) for f in chat_files_from_args]
-    # other_files for RepoMap are the effective_other_files, resolved after expansion.
-    other_files = [str(Path(f).resolve()) for f in effective_other_files_unresolved]
+    chat_files = list(dict.fromkeys(resolve_path_spec(f) for f in chat_files_from_args))
 
     # Convert mentioned files to sets
     mentioned_fnames = set(args.mentioned_files) if args.mentioned_files else None
@@ -160,9 +229,11 @@ Examples:
         verbose=args.verbose,
         max_context_window=args.max_context_window,
         exclude_unranked=args.exclude_unranked,
+        parse_workers=os.cpu_count(),
     )
 
-    print(f"Chat files: {chat_files}")
+    if args.verbose:
+        tool_output(f"Chat files: {len(chat_files)} files")
 
     # Generate the map
     try:
@@ -2,18 +2,30 @@
 RepoMap class for generating repository maps.
 """
 
+import heapq
+import math
+import multiprocessing
 import os
 import shutil
 import sqlite3
 import sys
 from collections import defaultdict
-from collections.abc import Callable
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 
 import diskcache
-import networkx as nx
-from grep_ast import TreeContext
+import numpy as np
+import scipy.sparse
+
+try:
+    from grep_ast import TreeContext, filename_to_lang
+    from grep_ast.tsl import get_language, get_parser
+    from tree_sitter import Language, Query, QueryCursor
+except ImportError:
+    print("Error: grep-ast is required. Install with: pip install grep-ast")
+    sys.exit(1)
 
 from .scm import get_scm_fname
 from .utils import Tag, count_tokens, read_text
@@ -28,11 +40,177 @@ class FileReport:
 
 
 # Constants
-CACHE_VERSION = 1
+CACHE_VERSION = 2
 
 TAGS_CACHE_DIR = os.path.join(os.getcwd(), f".repomap.tags.cache.v{CACHE_VERSION}")
 SQLITE_ERRORS = (sqlite3.OperationalError, sqlite3.DatabaseError)
 
+# Each parse worker spends ~0.5s importing numpy, scipy and grep_ast, while a file
+# parses in a few milliseconds, so below this many uncached files the pool isn't a win
+PARALLEL_PARSE_MIN_FILES = 256
+
+# Files handed to a parse worker per task
+PARALLEL_PARSE_CHUNKSIZE = 16
+
+# Tags query capture names are e.g. "name.definition.class" or "name.reference.call"
+DEF_CAPTURE_PREFIX = "name.definition"
+REF_CAPTURE_PREFIX = "name.reference"
+
+
+# Compiled tags queries by language. The SCM text is the same for every file of a
+# language, and compiling it costs milliseconds, so do it once per process.
+_TAGS_QUERY_CACHE: dict[str, Query | None] = {}
+
+
+def get_tags_query(lang: str, language: Language) -> Query | None:
+    """Get the compiled tags query for a language, or None if it has no SCM file."""
+    if lang not in _TAGS_QUERY_CACHE:
+        scm_fname = get_scm_fname(lang)
+        query_text = read_text(scm_fname, silent=True) if scm_fname else None
+        _TAGS_QUERY_CACHE[lang] = Query(language, query_text) if query_text else None
+    return _TAGS_QUERY_CACHE[lang]
+
+
+def parse_tags(
+    fname: str, rel_fname: str, file_reader_func: Callable[[str], str | None] = read_text
+) -> tuple[list[Tag], str | None]:
+    """Parse file to extract tags using Tree-sitter.
+
+    Returns the tags and an error message, if any. This is a module-level function so
+    it can run in worker processes.
+    """
+    lang = filename_to_lang(fname)
+    if not lang:
+        return [], None
+
+    try:
+        language = get_language(lang)
+        parser = get_parser(lang)
+    except Exception as err:
+        return [], f"Skipping file {fname}: {err}"
+
+    scm_fname = get_scm_fname(lang)
+    if not scm_fname:
+        return [], None
+
+    code = file_reader_func(fname)
+    if not code:
+        return [], None
+
+    try:
+        tree = parser.parse(bytes(code, "utf-8"))
+
+        # Load query from SCM file
+        query = get_tags_query(lang, language)
+        if query is None:
+            return [], None
+
+        cursor = QueryCursor(query)
+        captures = cursor.captures(tree.root_node)
+
+        # Identifiers repeat across this file's tags, and every tag shares its rel_fname,
+        # so intern them: duplicates collapse into one object, which pickle also stores
+        # once per cache entry. Tags loaded from the cache or from parse workers are not
+        # interned in this process, so don't rely on identity across files.
+        rel_fname = sys.intern(rel_fname)
+
+        tags = []
+        # Process captures as a dictionary. The kind only depends on the capture name,
+        # so decide it once per name and skip unneeded captures without visiting nodes.
+        for capture_name, nodes in captures.items():
+            if capture_name.startswith(DEF_CAPTURE_PREFIX):
+                kind = "def"
+            elif capture_name.startswith(REF_CAPTURE_PREFIX):
+                kind = "ref"
+            else:
+                # Skip other capture types like 'reference.call' if not needed for tagging
+                continue
+
+            tags.extend(
+                [
+                    Tag(
+                        rel_fname=rel_fname,
+                        fname=fname,
+                        line=node.start_point[0] + 1,
+                        # Handle potential None value
+                        name=sys.intern(node.text.decode("utf-8")) if node.text else "",
+                        kind=kind,
+                    )
+                    for node in nodes
+                ]
+            )
+
+        return tags, None
+
+    except Exception as e:
+        return [], f"Error parsing {fname}: {e}"
+
+
+def pagerank(
+    nodes: list[str],
+    edge_weights: dict[tuple[int, int], float],
+    personalization: dict[str, float] | None = None,
+    alpha: float = 0.85,
+    max_iter: int = 100,
+    tol: float = 1.0e-6,
+) -> dict[str, float]:
+    """PageRank by power iteration on a sparse transition matrix.
+
+    edge_weights maps (source index, target index) into nodes to an edge weight. This
+    matches networkx.pagerank on the equivalent weighted graph, including its handling of
+    personalization and of dangling nodes, without building a networkx graph.
+    """
+    n = len(nodes)
+    if n == 0:
+        return {}
+
+    if edge_weights:
+        rows, cols = zip(*edge_weights.keys(), strict=True)
+        data = np.fromiter(edge_weights.values(), dtype=float, count=len(edge_weights))
+    else:
+        rows, cols, data = (), (), np.empty(0)
+    matrix = scipy.sparse.csr_array((data, (rows, cols)), shape=(n, n))
+
+    # Row-normalize into transition probabilities
+    out_weight = matrix.sum(axis=1)
+    is_dangling = out_weight == 0
+    out_weight[~is_dangling] = 1.0 / out_weight[~is_dangling]
+    transitions = scipy.sparse.diags_array(out_weight) @ matrix
+
+    if personalization is None:
+        p = np.full(n, 1.0 / n)
+    else:
+        p = np.array([personalization.get(node, 0) for node in nodes], dtype=float)
+        if p.sum() == 0:
+            raise ZeroDivisionError("personalization has no weight on any node")
+        p /= p.sum()
+
+    # Dangling nodes jump according to the personalization vector
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * (x @ transitions + x[is_dangling].sum() * p) + (1 - alpha) * p
+        if np.abs(x - x_last).sum() < n * tol:
+            return dict(zip(nodes, x.tolist(), strict=True))
+
+    raise RuntimeError(f"PageRank failed to converge in {max_iter} iterations")
+
+
+# File reader used by parse worker processes, set by _init_parse_worker
+_worker_file_reader: Callable[[str], str | None] = read_text
+
+
+def _init_parse_worker(file_reader_func: Callable[[str], str | None]) -> None:
+    """Process pool initializer: install the RepoMap's file reader in the worker."""
+    global _worker_file_reader
+    _worker_file_reader = file_reader_func
+
+
+def _parse_tags_worker(item: tuple[str, str]) -> tuple[list[Tag], str | None]:
+    """Process pool task: parse one (fname, rel_fname) pair."""
+    fname, rel_fname = item
+    return parse_tags(fname, rel_fname, _worker_file_reader)
+
 
 class RepoMap:
     """Main class for generating repository maps."""
@@ -50,8 +228,14 @@ class RepoMap:
         map_mul_no_files: int = 8,
         refresh: str = "auto",
         exclude_unranked: bool = False,
+        parse_workers: int | None = None,
     ):
-        """Initialize RepoMap instance."""
+        """Initialize RepoMap instance.
+
+        parse_workers enables parsing uncached files in up to that many worker
+        processes. Workers re-import the caller's __main__ module, so only entry points
+        that guard their main code should turn it on.
+        """
         self.map_tokens = map_tokens
         self.max_map_tokens = map_tokens
         self.root = Path(root or os.getcwd()).resolve()
@@ -63,6 +247,7 @@ class RepoMap:
         self.map_mul_no_files = map_mul_no_files
         self.refresh = refresh
         self.exclude_unranked = exclude_unranked
+        self.parse_workers = parse_workers
 
         # Set up output handlers
         if output_handler_funcs is None:
@@ -73,6 +258,10 @@ class RepoMap:
         self.tree_cache = {}
         self.tree_context_cache = {}
         self.map_cache = {}
+        # self.root never changes, so absolute -> relative names can be memoized
+        self.rel_fname_cache: dict[str, str] = {}
+        # Measured by token_count on the first text it counts, used by estimate_tokens
+        self.chars_per_token: float | None = None
 
         # Load persistent tags cache
         self.load_tags_cache()
@@ -108,15 +297,18 @@ class RepoMap:
 
         len_text = len(text)
         if len_text < 200:
-            return self.token_count_func_internal(text)
-
-        # Sample for longer texts
-        lines = text.splitlines(keepends=True)
-        num_lines = len(lines)
-
-        step = max(1, num_lines // 100)
-        sampled_lines = lines[::step]
-        sample_text = "".join(sampled_lines)
+            tokens = self.token_count_func_internal(text)
+            if self.chars_per_token is None and tokens:
+                self.chars_per_token = len_text / tokens
+            return tokens
+
+        # Sample for longer texts: up to 50 evenly spaced windows of at most 80 chars,
+        # sliced straight out of the text rather than splitting it into lines. That is
+        # about as much text as 100 sampled lines, and fewer, wider windows split fewer
+        # tokens at their edges, which would inflate the estimate.
+        stride = max(1, len_text // 50)
+        window = min(stride, 80)
+        sample_text = "".join([text[i : i + window] for i in range(0, len_text, stride)])
 
         if not sample_text:
             return self.token_count_func_internal(text)
@@ -126,15 +318,32 @@ class RepoMap:
         if len(sample_text) == 0:
             return self.token_count_func_internal(text)
 
+        # Calibrate estimate_tokens from the first text we count
+        if self.chars_per_token is None and sample_tokens:
+            self.chars_per_token = len(sample_text) / sample_tokens
+
         est_tokens = (sample_tokens / len(sample_text)) * len_text
         return int(est_tokens)
 
+    def estimate_tokens(self, text: str) -> int:
+        """Cheaply estimate tokens from the calibrated chars-per-token ratio.
+
+        Until a ratio has been measured, falls back to token_count, which measures it.
+        """
+        if self.chars_per_token is None:
+            return self.token_count(text)
+        return int(len(text) / self.chars_per_token)
+
     def get_rel_fname(self, fname: str) -> str:
         """Get relative filename from absolute path."""
-        try:
-            return str(Path(fname).relative_to(self.root))
-        except ValueError:
-            return fname
+        rel_fname = self.rel_fname_cache.get(fname)
+        if rel_fname is None:
+            try:
+                rel_fname = str(Path(fname).relative_to(self.root))
+            except ValueError:
+                rel_fname = fname
+            self.rel_fname_cache[fname] = rel_fname
+        return rel_fname
 
     def get_mtime(self, fname: str) -> float | None:
         """Get file modification time."""
@@ -144,12 +353,18 @@ class RepoMap:
             self.output_handlers["warning"](f"File not found: {fname}")
             return None
 
-    def get_tags(self, fname: str, rel_fname: str) -> list[Tag]:
-        """Get tags for a file, using cache when possible."""
-        file_mtime = self.get_mtime(fname)
-        if file_mtime is None:
-            return []
+    def get_mtimes(self, fnames: list[str]) -> dict[str, float]:
+        """Get modification times for many files, omitting files that don't exist."""
+        mtimes = {}
+        for fname in fnames:
+            try:
+                mtimes[fname] = os.stat(fname).st_mtime
+            except (OSError, ValueError):
+                continue
+        return mtimes
 
+    def _get_cached_tags(self, fname: str, file_mtime: float) -> list[Tag] | None:
+        """Return cached tags for a file if the cache entry matches its mtime."""
         try:
             # Handle both diskcache Cache and in-memory dict
             if isinstance(self.TAGS_CACHE, dict):
@@ -157,87 +372,98 @@ class RepoMap:
             else:
                 cached_entry = self.TAGS_CACHE.get(fname)
 
-            if cached_entry and cached_entry.get("mtime") == file_mtime:
-                return cached_entry["data"]
+            # Entries are (mtime, tags) tuples
+            if cached_entry and cached_entry[0] == file_mtime:
+                return cached_entry[1]
         except SQLITE_ERRORS:
             self.tags_cache_error()
+        return None
 
-        # Cache miss or file changed
-        tags = self.get_tags_raw(fname, rel_fname)
-
+    def _set_cached_tags(self, fname: str, file_mtime: float, tags: list[Tag]) -> None:
+        """Store parsed tags for a file in the cache."""
         try:
-            self.TAGS_CACHE[fname] = {"mtime": file_mtime, "data": tags}
+            self.TAGS_CACHE[fname] = (file_mtime, tags)
         except SQLITE_ERRORS:
             self.tags_cache_error()
 
-        return tags
+    def get_tags(self, fname: str, rel_fname: str, file_mtime: float | None = None) -> list[Tag]:
+        """Get tags for a file, using cache when possible.
 
-    def get_tags_raw(self, fname: str, rel_fname: str) -> list[Tag]:
-        """Parse file to extract tags using Tree-sitter."""
-        try:
-            from grep_ast import filename_to_lang
-            from grep_ast.tsl import get_language, get_parser
-            from tree_sitter import QueryCursor
-        except ImportError:
-            print("Error: grep-ast is required. Install with: pip install grep-ast")
-            sys.exit(1)
-
-        lang = filename_to_lang(fname)
-        if not lang:
+        Pass file_mtime if it is already known, to save a stat call.
+        """
+        if file_mtime is None:
+            file_mtime = self.get_mtime(fname)
+        if file_mtime is None:
             return []
 
-        try:
-            language = get_language(lang)
-            parser = get_parser(lang)
-        except Exception as err:
-            self.output_handlers["error"](f"Skipping file {fname}: {err}")
-            return []
+        tags = self._get_cached_tags(fname, file_mtime)
+        if tags is not None:
+            return tags
 
-        scm_fname = get_scm_fname(lang)
-        if not scm_fname:
-            return []
+        # Cache miss or file changed
+        tags = self.get_tags_raw(fname, rel_fname)
+        self._set_cached_tags(fname, file_mtime, tags)
+        return tags
 
-        code = self.read_text_func_internal(fname)
-        if not code:
-            return []
+    def prefetch_tags(self, mtimes: dict[str, float]) -> dict[str, list[Tag]]:
+        """Look up cached tags and parse the misses in parallel worker processes.
 
-        try:
-            tree = parser.parse(bytes(code, "utf-8"))
-
-            # Load query from SCM file
-            query_text = read_text(scm_fname, silent=True)
-            if not query_text:
-                return []
-
-            query = language.query(query_text)
-            cursor = QueryCursor(query)
-            captures = cursor.captures(tree.root_node)
-
-            tags = []
-            # Process captures as a dictionary
-            for capture_name, nodes in captures.items():
-                for node in nodes:
-                    if "name.definition" in capture_name:
-                        kind = "def"
-                    elif "name.reference" in capture_name:
-                        kind = "ref"
-                    else:
-                        # Skip other capture types like 'reference.call' if not needed for tagging
-                        continue
-
-                    line_num = node.start_point[0] + 1
-                    # Handle potential None value
-                    name = node.text.decode("utf-8") if node.text else ""
-
-                    tags.append(
-                        Tag(rel_fname=rel_fname, fname=fname, line=line_num, name=name, kind=kind)
-                    )
+        Tree-sitter parsing is CPU bound, so if parse_workers allows it, on a cold cache
+        the misses are spread over a process pool and written back to the cache here.
+        mtimes maps the files to consider to their modification times, as returned by
+        get_mtimes. Returns the tags found or parsed, by filename; anything missing is
+        left for get_tags.
+        """
+        if (self.parse_workers or 0) < 2 or len(mtimes) < PARALLEL_PARSE_MIN_FILES:
+            return {}
+
+        found = {}
+        misses = []
+        for fname, file_mtime in mtimes.items():
+            tags = self._get_cached_tags(fname, file_mtime)
+            if tags is None:
+                misses.append((fname, self.get_rel_fname(fname), file_mtime))
+            else:
+                found[fname] = tags
 
-            return tags
+        if len(misses) < PARALLEL_PARSE_MIN_FILES:
+            return found
+
+        # Don't start workers that would get no chunk of files
+        workers = min(self.parse_workers, math.ceil(len(misses) / PARALLEL_PARSE_CHUNKSIZE))
 
+        # Forking is unsafe from a threaded process such as the MCP server, so start
+        # workers from a clean process instead
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                initializer=_init_parse_worker,
+                initargs=(self.read_text_func_internal,),
+            ) as pool:
+                results = pool.map(
+                    _parse_tags_worker,
+                    [(fname, rel_fname) for fname, rel_fname, _ in misses],
+                    chunksize=PARALLEL_PARSE_CHUNKSIZE,
+                )
+                for (fname, _, file_mtime), (tags, error) in zip(misses, results, strict=False):
+                    if error:
+                        self.output_handlers["error"](error)
+                    self._set_cached_tags(fname, file_mtime, tags)
+                    found[fname] = tags
         except Exception as e:
-            self.output_handlers["error"](f"Error parsing {fname}: {e}")
-            return []
+            self.output_handlers["warning"](f"Parallel parsing unavailable, parsing serially: {e}")
+        return found
+
+    def get_tags_raw(self, fname: str, rel_fname: str) -> list[Tag]:
+        """Parse file to extract tags using Tree-sitter."""
+        tags, error = parse_tags(fname, rel_fname, self.read_text_func_internal)
+        if error:
+            self.output_handlers["error"](error)
+        return tags
 
     def get_ranked_tags(
         self,
@@ -245,11 +471,30 @@ class RepoMap:
         other_fnames: list[str],
         mentioned_fnames: set[str] | None = None,
         mentioned_idents: set[str] | None = None,
+        chat_rel_fnames: set[str] | None = None,
+    ) -> tuple[list[tuple[float, Tag]], FileReport]:
+        """Get ranked tags using PageRank algorithm with file report.
+
+        chat_rel_fnames may be passed if the caller already computed it.
+        """
+        ranked_tags, file_report = self._rank_tags(
+            chat_fnames, other_fnames, mentioned_fnames, mentioned_idents, chat_rel_fnames
+        )
+        ranked_tags.sort(key=lambda x: x[0], reverse=True)
+        return ranked_tags, file_report
+
+    def _rank_tags(
+        self,
+        chat_fnames: list[str],
+        other_fnames: list[str],
+        mentioned_fnames: set[str] | None = None,
+        mentioned_idents: set[str] | None = None,
+        chat_rel_fnames: set[str] | None = None,
     ) -> tuple[list[tuple[float, Tag]], FileReport]:
-        """Get ranked tags using PageRank algorithm with file report."""
+        """Like get_ranked_tags, but leaves the ranked tags in file order, unsorted."""
         # Return empty list and empty report if no files
         if not chat_fnames and not other_fnames:
-            return [], FileReport([], {}, 0, 0, 0)
+            return [], FileReport({}, 0, 0, 0)
 
         # Initialize file report early
         included: list[str] = []
@@ -268,26 +513,35 @@ class RepoMap:
         chat_fnames = [normalize_path(f) for f in chat_fnames]
         other_fnames = [normalize_path(f) for f in other_fnames]
 
-        # Initialize file report
-        included: list[str] = []
-        excluded: dict[str, str] = {}
-        total_definitions = 0
-        total_references = 0
+        # Collect all tags. Identifiers map to the indices in nodes of the files that
+        # define or reference them, which is far lighter than a set of names per identifier.
+        defines: dict[str, list[int]] = {}
+        references: dict[str, list[int]] = {}
 
-        # Collect all tags
-        defines = defaultdict(set)
-        references = defaultdict(set)
-        definitions = defaultdict(set)
+        # Tags of each included file, kept for ranking after PageRank
+        file_tags_by_fname: dict[str, list[Tag]] = {}
 
         personalization = {}
-        chat_rel_fnames = set(self.get_rel_fname(f) for f in chat_fnames)
+        if chat_rel_fnames is None:
+            chat_rel_fnames = set(self.get_rel_fname(f) for f in chat_fnames)
+
+        # Deduplicate, keeping the input order so node order is deterministic
+        all_fnames = list(dict.fromkeys(chat_fnames + other_fnames))
+
+        # One graph node per file
+        nodes = list(dict.fromkeys(self.get_rel_fname(fname) for fname in all_fnames))
+        node_idx = {node: i for i, node in enumerate(nodes)}
 
-        all_fnames = list(set(chat_fnames + other_fnames))
+        # Stat every file once; the mtimes double as the existence check below
+        mtimes = self.get_mtimes(all_fnames)
+
+        # Parse uncached files in parallel up front; the loop below then reuses the tags
+        prefetched = self.prefetch_tags(mtimes)
 
         for fname in all_fnames:
             rel_fname = self.get_rel_fname(fname)
 
-            if not os.path.exists(fname):
+            if fname not in mtimes:
                 reason = "File not found"
                 excluded[fname] = reason
                 self.output_handlers["warning"](f"Repo-map can't include {fname}: {reason}")
@@ -295,57 +549,57 @@ class RepoMap:
 
             included.append(fname)
 
-            tags = self.get_tags(fname, rel_fname)
+            tags = prefetched.get(fname)
+            if tags is None:
+                tags = self.get_tags(fname, rel_fname, mtimes[fname])
+            file_tags_by_fname[fname] = tags
+            file_idx = node_idx[rel_fname]
 
             for tag in tags:
                 if tag.kind == "def":
-                    defines[tag.name].add(rel_fname)
-                    definitions[rel_fname].add(tag.name)
+                    defines.setdefault(tag.name, []).append(file_idx)
                     total_definitions += 1
                 elif tag.kind == "ref":
-                    references[tag.name].add(rel_fname)
+                    references.setdefault(tag.name, []).append(file_idx)
                     total_references += 1
 
             # Set personalization for chat files
             if fname in chat_fnames:
                 personalization[rel_fname] = 100.0
 
-        # Build graph
-        G = nx.MultiDiGraph()
-
-        # Add nodes
-        for fname in all_fnames:
-            rel_fname = self.get_rel_fname(fname)
-            G.add_node(rel_fname)
-
-        # Add edges based on references
-        for name, ref_fnames in references.items():
-            def_fnames = defines.get(name, set())
-            for ref_fname in ref_fnames:
-                for def_fname in def_fnames:
-                    if ref_fname != def_fname:
-                        G.add_edge(ref_fname, def_fname, name=name)
+        # Build graph: an edge from each referencing file to each defining file per shared
+        # identifier (repeated edges add up as weight). A file counts once per identifier.
+        edge_weights: dict[tuple[int, int], int] = defaultdict(int)
+        for name, ref_idxs in references.items():
+            def_idxs = defines.get(name)
+            if not def_idxs:
+                continue
+            def_idxs = list(dict.fromkeys(def_idxs))
+            for ref_idx in dict.fromkeys(ref_idxs):
+                for def_idx in def_idxs:
+                    if ref_idx != def_idx:
+                        edge_weights[ref_idx, def_idx] += 1
 
-        if not G.nodes():
+        if not nodes:
             return [], FileReport(excluded, 0, 0, len(all_fnames))
 
         # Run PageRank
         try:
             if personalization:
-                ranks = nx.pagerank(G, personalization=personalization, alpha=0.85)
+                ranks = pagerank(nodes, edge_weights, personalization=personalization)
             else:
-                ranks = nx.pagerank(G, alpha=0.85)
+                ranks = pagerank(nodes, edge_weights)
         except Exception as e:
             print(f"Error during PageRank: {e}")
             try:
                 # If personalization caused the crash, try standard PageRank
-                ranks = nx.pagerank(G, alpha=0.85)
+                ranks = pagerank(nodes, edge_weights)
             except Exception:
                 # If both fail, fallback to uniform
-                ranks = {node: 1.0 for node in G.nodes()}
+                ranks = {node: 1.0 for node in nodes}
 
         # Update excluded dictionary with status information
-        for fname in set(chat_fnames + other_fnames):
+        for fname in all_fnames:
             if fname in excluded:
                 # Add status prefix to existing exclusion reason
                 excluded[fname] = f"[EXCLUDED] {excluded[fname]}"
@@ -373,27 +627,27 @@ class RepoMap:
             ):  # Use a small threshold to exclude near-zero ranks
                 continue
 
-            tags = self.get_tags(fname, rel_fname)
-            for tag in tags:
-                if tag.kind == "def":
-                    # Boost for mentioned identifiers
-                    boost = 1.0
-                    if tag.name in mentioned_idents:
-                        boost *= 10.0
-                    if rel_fname in mentioned_fnames:
-                        boost *= 5.0
-                    if rel_fname in chat_rel_fnames:
-                        boost *= 20.0
-
-                    final_rank = file_rank * boost
-                    ranked_tags.append((final_rank, tag))
-
-        # Sort by rank (descending)
-        ranked_tags.sort(key=lambda x: x[0], reverse=True)
+            # The file boosts are the same for every tag of the file, so only the
+            # mentioned identifier check is left to do per tag
+            file_boost = 1.0
+            if rel_fname in mentioned_fnames:
+                file_boost *= 5.0
+            if rel_fname in chat_rel_fnames:
+                file_boost *= 20.0
+            file_tag_rank = file_rank * file_boost
+            mentioned_tag_rank = file_rank * (10.0 * file_boost)
+
+            ranked_tags.extend(
+                [
+                    (mentioned_tag_rank if tag.name in mentioned_idents else file_tag_rank, tag)
+                    for tag in file_tags_by_fname[fname]
+                    if tag.kind == "def"
+                ]
+            )
 
         return ranked_tags, file_report
 
-    def render_tree(self, abs_fname: str, rel_fname: str, lois: list[int]) -> str:
+    def render_tree(self, abs_fname: str, rel_fname: str, lois: Iterable[int]) -> str:
         """Render a code snippet with specific lines of interest."""
         code = self.read_text_func_internal(abs_fname)
         if not code:
@@ -417,8 +671,18 @@ class RepoMap:
 
             return "\n".join(result_lines)
 
-    def to_tree(self, tags: list[tuple[float, Tag]], chat_rel_fnames: set[str]) -> str:
-        """Convert ranked tags to formatted tree output."""
+    def to_tree(
+        self,
+        tags: list[tuple[float, Tag]],
+        chat_rel_fnames: set[str],
+        section_cache: dict[tuple[str, tuple[int, ...]], str] | None = None,
+    ) -> str:
+        """Convert ranked tags to formatted tree output.
+
+        If section_cache is given, each file's rendered section is stored in it keyed by
+        (rel_fname, lines of interest), so repeated calls over overlapping tag lists only
+        render the files whose lines of interest changed.
+        """
         if not tags:
             return ""
 
@@ -438,27 +702,44 @@ class RepoMap:
             # Get lines of interest
             lois = [tag.line for rank, tag in file_tag_list]
 
-            # Find absolute filename
-            abs_fname = str(self.root / rel_fname)
+            cache_key = (rel_fname, tuple(lois))
+            if section_cache is not None and cache_key in section_cache:
+                section = section_cache[cache_key]
+            else:
+                section = self.render_file_section(rel_fname, file_tag_list, lois)
+                if section_cache is not None:
+                    section_cache[cache_key] = section
+
+            if section:
+                tree_parts.append(section)
 
-            # Get the max rank for the file
-            max_rank = max(rank for rank, tag in file_tag_list)
+        return "\n\n".join(tree_parts)
 
-            # Render the tree for this file
-            rendered = self.render_tree(abs_fname, rel_fname, lois)
-            if rendered:
-                # Add rank value to the output
-                rendered_lines = rendered.splitlines()
-                first_line = rendered_lines[0]
-                code_lines = rendered_lines[1:]
+    def render_file_section(
+        self, rel_fname: str, file_tag_list: list[tuple[float, Tag]], lois: list[int]
+    ) -> str:
+        """Render one file's part of the tree output, headed by its rank value."""
+        # Find absolute filename
+        abs_fname = str(self.root / rel_fname)
 
-                tree_parts.append(
-                    f"{first_line}\n"
-                    f"(Rank value: {max_rank:.4f})\n\n"  # Added an extra newline here
-                    + "\n".join(code_lines)
-                )
+        # Get the max rank for the file
+        max_rank = max(rank for rank, tag in file_tag_list)
 
-        return "\n\n".join(tree_parts)
+        # Render the tree for this file
+        rendered = self.render_tree(abs_fname, rel_fname, lois)
+        if not rendered:
+            return ""
+
+        # Add rank value to the output
+        rendered_lines = rendered.splitlines()
+        first_line = rendered_lines[0]
+        code_lines = rendered_lines[1:]
+
+        return (
+            f"{first_line}\n"
+            f"(Rank value: {max_rank:.4f})\n\n"  # Added an extra newline here
+            + "\n".join(code_lines)
+        )
 
     def get_ranked_tags_map(
         self,
@@ -470,12 +751,14 @@ class RepoMap:
         force_refresh: bool = False,
     ) -> str | None:
         """Get the ranked tags map with caching."""
+        # Frozensets are order-independent like the inputs' meaning, need no sort, and
+        # cache their own hash, so the key is cheap to build and to look up
         cache_key = (
-            tuple(sorted(chat_fnames)),
-            tuple(sorted(other_fnames)),
+            frozenset(chat_fnames),
+            frozenset(other_fnames),
             max_map_tokens,
-            tuple(sorted(mentioned_fnames or [])),
-            tuple(sorted(mentioned_idents or [])),
+            frozenset(mentioned_fnames or ()),
+            frozenset(mentioned_idents or ()),
         )
 
         if not force_refresh and cache_key in self.map_cache:
@@ -548,22 +831,41 @@ class RepoMap:
         mentioned_idents: set[str] | None = None,
     ) -> tuple[str | None, FileReport]:
         """Generate the ranked tags map without caching."""
-        ranked_tags, file_report = self.get_ranked_tags(
-            chat_fnames, other_fnames, mentioned_fnames, mentioned_idents
+        # Computed once here for both ranking and rendering
+        chat_rel_fnames = set(self.get_rel_fname(str(Path(f).resolve())) for f in chat_fnames)
+
+        all_ranked_tags, file_report = self._rank_tags(
+            chat_fnames, other_fnames, mentioned_fnames, mentioned_idents, chat_rel_fnames
         )
 
+        # Every tag costs at least a couple of tokens, so no more than this many can fit.
+        # Taking just those off a heap is much cheaper than sorting everything, and gives
+        # the same order as a full stable sort.
+        max_tags = max_map_tokens // 2 + 100
+        truncated = len(all_ranked_tags) > max_tags
+        if truncated:
+            ranked_tags = heapq.nlargest(max_tags, all_ranked_tags, key=lambda x: x[0])
+        else:
+            all_ranked_tags.sort(key=lambda x: x[0], reverse=True)
+            ranked_tags = all_ranked_tags
+
         if not ranked_tags:
             return None, file_report
 
         # Binary search to find the right number of tags
-        chat_rel_fnames = set(self.get_rel_fname(f) for f in chat_fnames)
 
-        def try_tags(num_tags: int) -> tuple[str | None, int, set[str]]:
+        # Probes share most of their files with earlier probes, so keep every rendered
+        # file section for the duration of the search instead of re-rendering it
+        section_cache: dict[tuple[str, tuple[int, ...]], str] = {}
+
+        def try_tags(
+            num_tags: int, count_func: Callable[[str], int]
+        ) -> tuple[str | None, int, set[str]]:
             if num_tags <= 0:
                 return None, 0, set()
 
             selected_tags = ranked_tags[:num_tags]
-            tree_output = self.to_tree(selected_tags, chat_rel_fnames)
+            tree_output = self.to_tree(selected_tags, chat_rel_fnames, section_cache)
 
             if not tree_output:
                 return None, 0, set()
@@ -571,29 +873,58 @@ class RepoMap:
             # Extract files that are in this output
             files_in_output = set(tag.fname for rank, tag in selected_tags)
 
-            tokens = self.token_count(tree_output)
+            tokens = count_func(tree_output)
             return tree_output, tokens, files_in_output
 
-        # Binary search for optimal number of tags
-        left, right = 0, len(ranked_tags)
-        best_tree = None
-        best_files = set()
-
-        while left <= right:
-            mid = (left + right) // 2
-            tree_output, tokens, files_in_output = try_tags(mid)
-
-            if tree_output and tokens <= max_map_tokens:
-                best_tree = tree_output
-                best_files = files_in_output
-                left = mid + 1
-            else:
-                right = mid - 1
+        def search(
+            left: int, right: int, count_func: Callable[[str], int]
+        ) -> tuple[str | None, set[str], int]:
+            """Binary search for the largest number of tags that fits the budget."""
+            best_tree = None
+            best_files = set()
+            best_num_tags = 0
+
+            while left <= right:
+                mid = (left + right) // 2
+                tree_output, tokens, files_in_output = try_tags(mid, count_func)
+
+                if tree_output and tokens <= max_map_tokens:
+                    best_tree = tree_output
+                    best_files = files_in_output
+                    best_num_tags = mid
+                    left = mid + 1
+                else:
+                    right = mid - 1
+
+            return best_tree, best_files, best_num_tags
+
+        def fit() -> tuple[str | None, set[str], int]:
+            """Find the largest prefix of ranked_tags that fits max_map_tokens."""
+            # Probe with the cheap estimate, then check the winner against real counts and
+            # search again with them on whichever side the estimate got wrong
+            best = search(0, len(ranked_tags), self.estimate_tokens)
+            if not best[0]:
+                return search(0, len(ranked_tags), self.token_count)
+            if self.token_count(best[0]) > max_map_tokens:
+                return search(0, best[2] - 1, self.token_count)
+            if best[2] < len(ranked_tags):
+                next_tree, next_tokens, _ = try_tags(best[2] + 1, self.token_count)
+                if next_tree and next_tokens <= max_map_tokens:
+                    return search(best[2] + 1, len(ranked_tags), self.token_count)
+            return best
+
+        best_tree, best_files, best_num_tags = fit()
+        if truncated and best_num_tags >= len(ranked_tags):
+            # Even the last of the top tags fit, so the limit cut the map short (e.g. many
+            # tags sharing lines). Sort the rest in and search again.
+            all_ranked_tags.sort(key=lambda x: x[0], reverse=True)
+            ranked_tags = all_ranked_tags
+            best_tree, best_files, best_num_tags = fit()
 
         # Generate file overview if we have a tree (only when verbose)
         if best_tree:
             if self.verbose:
-                all_files = list(set(chat_fnames + other_fnames))
+                all_files = list(dict.fromkeys(chat_fnames + other_fnames))
                 overview = self.generate_file_overview(all_files, best_files, file_report)
                 if overview:
                     best_tree = best_tree + "\n\n" + overview
@@ -1,31 +1,77 @@
 import asyncio
+import heapq
+import itertools
 import logging
 import os
+from collections import OrderedDict
 from pathlib import Path
 from typing import Any
 
 from fastmcp import FastMCP, settings
 
+from .repomap import find_src_files
 from .repomap_class import RepoMap
-from .utils import count_tokens, read_text
-
-
-# Helper function from your CLI, useful to have here
-def find_src_files(directory: str) -> list[str]:
-    if not os.path.isdir(directory):
-        return [directory] if os.path.isfile(directory) else []
-    src_files = []
-    for r, d, f_list in os.walk(directory):
-        d[:] = [
-            d_name
-            for d_name in d
-            if not d_name.startswith(".")
-            and d_name not in {"node_modules", "__pycache__", "venv", "env"}
-        ]
-        for f in f_list:
-            if not f.startswith("."):
-                src_files.append(os.path.join(r, f))
-    return src_files
+from .utils import Tag, count_tokens, read_text
+
+# Directories never worth walking (hidden ones are skipped anyway)
+_PRUNE_DIRS = frozenset({"node_modules", "__pycache__", "venv", "env"})
+
+
+def _index_tags_by_name(tags: list[Tag]) -> dict[str, list[int]]:
+    """Map each lowercased tag name to the positions in tags of the tags with that name."""
+    # Group by the exact (interned) name first, so each distinct name is lowercased once
+    # rather than once per tag
+    by_exact_name: dict[str, list[int]] = {}
+    for i, tag in enumerate(tags):
+        by_exact_name.setdefault(tag.name, []).append(i)
+
+    by_name: dict[str, list[int]] = {}
+    for name, tag_idxs in by_exact_name.items():
+        by_name.setdefault(name.lower(), []).extend(tag_idxs)
+    return by_name
+
+
+def _list_project_files(project_root: str) -> tuple[list[str], int]:
+    """List a project's source files, with a fingerprint of their paths and mtimes."""
+    # Sorted so the walk order, which varies between walks, changes neither the
+    # fingerprint nor the order of results
+    files = sorted(find_src_files(project_root, _PRUNE_DIRS))
+    mtimes = []
+    for file_path in files:
+        try:
+            mtimes.append(os.stat(file_path).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return files, hash((tuple(files), tuple(mtimes)))
+
+
+def _validate_params(
+    project_root: str, token_limit: Any = 8192
+) -> tuple[dict[str, Any] | None, dict[str, Any] | None]:
+    """Check and normalize tool parameters, before any expensive setup.
+
+    Returns (normalized parameters, None), or (None, error result) if they are invalid.
+    """
+    if not os.path.isdir(project_root):
+        return None, {"error": f"Project root directory not found: {project_root}"}
+
+    # Convert token_limit to integer with fallback
+    try:
+        token_limit = int(token_limit) if token_limit else 8192
+    except (TypeError, ValueError):
+        token_limit = 8192
+
+    # Ensure token_limit is positive
+    if token_limit <= 0:
+        token_limit = 8192
+
+    return {"token_limit": token_limit}, None
+
+
+# Tag indexes of recently searched projects, least recently used first:
+# project_root -> (fingerprint, tags, tags by lowercased name)
+_INDEX_CACHE: OrderedDict[str, tuple[int, list[Tag], dict[str, list[int]]]] = OrderedDict()
+_INDEX_CACHE_SIZE = 4
 
 
 # Configure logging - only show errors
@@ -94,19 +140,11 @@ async def repo_map(
             - 'total_files_considered': total files processed
         Or an 'error' key if an error occurred.
     """
-    if not os.path.isdir(project_root):
-        return {"error": f"Project root directory not found: {project_root}"}
-
-    # 1. Handle and validate parameters
-    # Convert token_limit to integer with fallback
-    try:
-        token_limit = int(token_limit) if token_limit else 8192
-    except (TypeError, ValueError):
-        token_limit = 8192
-
-    # Ensure token_limit is positive
-    if token_limit <= 0:
-        token_limit = 8192
+    # 1. Handle and validate parameters, before any expensive setup
+    params, error = _validate_params(project_root, token_limit)
+    if error:
+        return error
+    token_limit = params["token_limit"]
 
     chat_files_list = chat_files or []
     mentioned_fnames_set = set(mentioned_files) if mentioned_files else None
@@ -114,27 +152,26 @@ async def repo_map(
 
     # 2. If a specific list of other_files isn't provided, scan the whole root directory.
     # This should happen regardless of whether chat_files are present.
-    effective_other_files = []
     if other_files:
         effective_other_files = other_files
     else:
         log.info("No other_files provided, scanning root directory for context...")
-        effective_other_files = find_src_files(project_root)
+        effective_other_files = find_src_files(project_root, _PRUNE_DIRS)
+
+    # 3. Resolve paths relative to project root. This consumes the walk as it goes.
+    root_path = Path(project_root).resolve()
+    abs_chat_files = [str(root_path / f) for f in chat_files_list]
+    abs_other_files = [str(root_path / f) for f in effective_other_files]
 
     # Add a print statement for debugging so you can see what the tool is working with.
-    log.debug(f"Chat files: {chat_files_list}")
-    log.debug(f"Effective other_files count: {len(effective_other_files)}")
+    log.debug("Chat files: %s", chat_files_list)
+    log.debug("Effective other_files count: %d", len(abs_other_files))
 
     # If after all that we have no files, we can exit early.
-    if not chat_files_list and not effective_other_files:
+    if not abs_chat_files and not abs_other_files:
         log.info("No files to process.")
         return {"map": "No files found to generate a map."}
 
-    # 3. Resolve paths relative to project root
-    root_path = Path(project_root).resolve()
-    abs_chat_files = [str(root_path / f) for f in chat_files_list]
-    abs_other_files = [str(root_path / f) for f in effective_other_files]
-
     # Remove any chat files from the other_files list to avoid duplication
     abs_chat_files_set = set(abs_chat_files)
     abs_other_files = [f for f in abs_other_files if f not in abs_chat_files_set]
@@ -150,9 +187,10 @@ async def repo_map(
             verbose=verbose,
             exclude_unranked=exclude_unranked,
             max_context_window=max_context_window,
+            parse_workers=os.cpu_count(),
         )
     except Exception as e:
-        log.exception(f"Failed to initialize RepoMap for project '{project_root}': {e}")
+        log.exception("Failed to initialize RepoMap for project '%s': %s", project_root, e)
         return {"error": f"Failed to initialize RepoMap: {str(e)}"}
 
     try:
@@ -178,7 +216,7 @@ async def repo_map(
             "report": report_dict,
         }
     except Exception as e:
-        log.exception(f"Error generating repository map for project '{project_root}': {e}")
+        log.exception("Error generating repository map for project '%s': %s", project_root, e)
         return {"error": f"Error generating repository map: {str(e)}"}
 
 
@@ -206,8 +244,12 @@ async def search_identifiers(
     Returns:
         Dictionary containing search results or error message
     """
-    if not os.path.isdir(project_root):
-        return {"error": f"Project root directory not found: {project_root}"}
+    _, error = _validate_params(project_root)
+    if error:
+        return error
+
+    # Strip trailing and doubled separators, so the walk's paths all share one prefix
+    project_root = os.path.normpath(project_root)
 
     try:
         # Initialize RepoMap with search-specific settings
@@ -220,45 +262,81 @@ async def search_identifiers(
             exclude_unranked=True,
         )
 
-        # Find all source files in the project
-        all_files = find_src_files(project_root)
-
-        # Get all tags (definitions and references) for all files
-        all_tags = []
-        for file_path in all_files:
-            rel_path = str(Path(file_path).relative_to(project_root))
-            tags = repo_map.get_tags(file_path, rel_path)
-            all_tags.extend(tags)
+        parse_slots = asyncio.Semaphore(os.cpu_count() or 1)
+
+        # The tag index doesn't depend on the query, so reuse it while no file changed
+        all_files, fingerprint = await asyncio.to_thread(_list_project_files, project_root)
+        cached_index = _INDEX_CACHE.get(project_root)
+        if cached_index is not None and cached_index[0] == fingerprint:
+            _INDEX_CACHE.move_to_end(project_root)
+            _, all_tags, by_name = cached_index
+        else:
+            # Get all tags (definitions and references) for all source files in the
+            # project. Files are independent and tree-sitter parses outside the GIL, so
+            # tag them on worker threads, at most one per CPU at a time.
+            # The walk joins every path onto the normalised project_root, so the relative
+            # path is a plain slice past that prefix
+            root_prefix_len = len(os.path.join(project_root, ""))
+
+            async def get_file_tags(file_path: str) -> list:
+                rel_path = file_path[root_prefix_len:]
+                async with parse_slots:
+                    return await asyncio.to_thread(repo_map.get_tags, file_path, rel_path)
+
+            tags_by_file = await asyncio.gather(
+                *[get_file_tags(file_path) for file_path in all_files]
+            )
+            all_tags = list(itertools.chain.from_iterable(tags_by_file))
+            by_name = _index_tags_by_name(all_tags)
+
+            _INDEX_CACHE[project_root] = (fingerprint, all_tags, by_name)
+            _INDEX_CACHE.move_to_end(project_root)
+            if len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+                _INDEX_CACHE.popitem(last=False)
 
         # Filter tags based on search query and options
-        matching_tags = []
         query_lower = query.lower()
+        kinds = set()
+        if include_definitions:
+            kinds.add("def")
+        if include_references:
+            kinds.add("ref")
+
+        # Many tags share a name, so search each distinct name only once
+        matches = []
+        for name_lower, tag_idxs in by_name.items():
+            pos = name_lower.find(query_lower)
+            if pos >= 0:
+                matches.extend(
+                    (all_tags[i].kind != "def", pos, i)
+                    for i in tag_idxs
+                    if all_tags[i].kind in kinds
+                )
 
-        for tag in all_tags:
-            if query_lower in tag.name.lower():
-                if (tag.kind == "def" and include_definitions) or (
-                    tag.kind == "ref" and include_references
-                ):
-                    matching_tags.append(tag)
-
-        # Sort by relevance (definitions first, then references)
-        matching_tags.sort(key=lambda x: (x.kind != "def", x.name.lower().find(query_lower)))
-
-        # Limit results
-        matching_tags = matching_tags[:max_results]
+        # Sort by relevance (definitions first, then references), then in walk order,
+        # keeping only the best max_results. A bounded heap beats sorting every match.
+        top_matches = heapq.nsmallest(max_results, matches)
+        matching_tags = [all_tags[i] for _, _, i in top_matches]
 
-        # Format results with context
-        results = []
-        for tag in matching_tags:
+        # Format results with context. Rendering reads and parses each matched file, so
+        # overlap those on worker threads too.
+        async def get_tag_context(tag) -> str:
             file_path = str(Path(project_root) / tag.rel_fname)
 
             # Calculate context range based on context_lines parameter
             start_line = max(1, tag.line - context_lines)
             end_line = tag.line + context_lines
-            context_range = list(range(start_line, end_line + 1))
+            context_range = range(start_line, end_line + 1)
 
-            context = repo_map.render_tree(file_path, tag.rel_fname, context_range)
+            async with parse_slots:
+                return await asyncio.to_thread(
+                    repo_map.render_tree, file_path, tag.rel_fname, context_range
+                )
 
+        contexts = await asyncio.gather(*[get_tag_context(tag) for tag in matching_tags])
+
+        results = []
+        for tag, context in zip(matching_tags, contexts, strict=True):
             if context:
                 results.append(
                     {
@@ -273,7 +351,7 @@ async def search_identifiers(
         return {"results": results}
 
     except Exception as e:
-        log.exception(f"Error searching identifiers in project '{project_root}': {e}")
+        log.exception("Error searching identifiers in project '%s': %s", project_root, e)
         return {"error": f"Error searching identifiers: {str(e)}"}
 
 
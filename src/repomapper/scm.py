@@ -4,56 +4,25 @@ SCM file handling for RepoMap.
 
 from pathlib import Path
 
+_QUERIES_DIR = Path(__file__).parent / "queries"
+
+# Query sets to search, in order of preference
+_QUERY_SUBDIRS = ("tree-sitter-language-pack", "tree-sitter-languages")
+
+
+def _find_scm_files() -> dict[str, str]:
+    """Map each language to its <lang>-tags.scm query file, preferring earlier subdirectories."""
+    scm_paths = {}
+    for subdir in _QUERY_SUBDIRS:
+        for scm_path in sorted((_QUERIES_DIR / subdir).glob("*-tags.scm")):
+            scm_paths.setdefault(scm_path.name.removesuffix("-tags.scm"), str(scm_path))
+    return scm_paths
+
+
+# The query files ship with the package, so list them once at import
+_SCM_PATHS = _find_scm_files()
+
 
 def get_scm_fname(lang: str) -> str | None:
     """Get the SCM query file for a language."""
-    scm_files = {
-        "arduino": "arduino-tags.scm",
-        "chatito": "chatito-tags.scm",
-        "commonlisp": "commonlisp-tags.scm",
-        "cpp": "cpp-tags.scm",
-        "csharp": "csharp-tags.scm",
-        "c": "c-tags.scm",
-        "dart": "dart-tags.scm",
-        "d": "d-tags.scm",
-        "elisp": "elisp-tags.scm",
-        "elixir": "elixir-tags.scm",
-        "elm": "elm-tags.scm",
-        "gleam": "gleam-tags.scm",
-        "go": "go-tags.scm",
-        "javascript": "javascript-tags.scm",
-        "java": "java-tags.scm",
-        "lua": "lua-tags.scm",
-        "ocaml_interface": "ocaml_interface-tags.scm",
-        "ocaml": "ocaml-tags.scm",
-        "pony": "pony-tags.scm",
-        "properties": "properties-tags.scm",
-        "python": "python-tags.scm",
-        "racket": "racket-tags.scm",
-        "r": "r-tags.scm",
-        "ruby": "ruby-tags.scm",
-        "rust": "rust-tags.scm",
-        "solidity": "solidity-tags.scm",
-        "swift": "swift-tags.scm",
-        "udev": "udev-tags.scm",
-        "c_sharp": "c_sharp-tags.scm",
-        "hcl": "hcl-tags.scm",
-        "kotlin": "kotlin-tags.scm",
-        "php": "php-tags.scm",
-        "ql": "ql-tags.scm",
-        "scala": "scala-tags.scm",
-        "typescript": "typescript-tags.scm",
-    }
-
-    if lang in scm_files:
-        scm_filename = scm_files[lang]
-        # Search in tree-sitter-language-pack
-        scm_path = Path(__file__).parent / "queries" / "tree-sitter-language-pack" / scm_filename
-        if scm_path.exists():
-            return str(scm_path)
-        # Search in tree-sitter-languages
-        scm_path = Path(__file__).parent / "queries" / "tree-sitter-languages" / scm_filename
-        if scm_path.exists():
-            return str(scm_path)
-
-    return None
+    return _SCM_PATHS.get(lang)
@@ -3,8 +3,8 @@ Utility functions for RepoMap.
 """
 
 import sys
-from collections import namedtuple
-from pathlib import Path
+from functools import lru_cache
+from typing import NamedTuple
 
 try:
     import tiktoken
@@ -12,28 +12,45 @@ except ImportError:
     print("Error: tiktoken is required. Install with: pip install tiktoken")
     sys.exit(1)
 
-# Tag namedtuple for storing parsed code definitions and references
-Tag = namedtuple("Tag", "rel_fname fname line name kind".split())
 
+class Tag(NamedTuple):
+    """A parsed code definition or reference."""
+
+    rel_fname: str
+    fname: str
+    line: int
+    name: str
+    kind: str
 
-def count_tokens(text: str, model_name: str = "gpt-4") -> int:
-    """Count tokens in text using tiktoken."""
-    if not text:
-        return 0
 
+@lru_cache(maxsize=8)
+def _get_encoding(model_name: str) -> tiktoken.Encoding:
+    """Get the tiktoken encoding for a model, resolved once per model name."""
     try:
-        encoding = tiktoken.encoding_for_model(model_name)
+        return tiktoken.encoding_for_model(model_name)
     except KeyError:
         # Fallback for unknown models
-        encoding = tiktoken.get_encoding("cl100k_base")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model_name: str = "gpt-4") -> int:
+    """Count tokens in text using tiktoken."""
+    if not text:
+        return 0
 
-    return len(encoding.encode(text))
+    return len(_get_encoding(model_name).encode(text))
 
 
 def read_text(filename: str, encoding: str = "utf-8", silent: bool = False) -> str | None:
     """Read text from file with error handling."""
     try:
-        return Path(filename).read_text(encoding=encoding, errors="ignore")
+        # One binary read and one decode, skipping the text layer
+        with open(filename, "rb") as f:
+            text = f.read().decode(encoding, errors="ignore")
+        # Translate newlines the way text mode would
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
     except FileNotFoundError:
         if not silent:
             print(f"Error: {filename} not found.")